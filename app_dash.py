@@ -1,12 +1,69 @@
+import functools
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+import orjson
 import pandas as pd
 import plotly.express as px
+import plotly.io as pio
+import polars as pl
 import dash
 from dash import dcc, html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from flask_caching import Cache
+
+# Serializando figuras com orjson (usado pelo plotly.io e pelas respostas do Dash)
+pio.json.config.default_engine = 'orjson'
+
+CSV_URL = 'https://raw.githubusercontent.com/07leonam/plot_vsd/refs/heads/main/Summer_olympic_Medals.csv'
+# Versão do formato do cache: incrementar sempre que mudar o que é gravado no Parquet,
+# assim um cache antigo é ignorado e o CSV é baixado de novo
+CACHE_VERSION = 3
+CACHE_PATH = Path(f'.cache/medals-v{CACHE_VERSION}.parquet')
+expected_cols_from_user = ['Year', 'Host_country', 'Host_city', 'Country_Name', 'Country_Code', 'Gold', 'Silver', 'Bronze']
+expected_dtypes = {
+    'Year': 'int16',
+    'Gold': 'int16',
+    'Silver': 'int16',
+    'Bronze': 'int16',
+    'Country_Name': 'category',
+    'Country_Code': 'category',
+    'Host_country': 'category',
+    'Host_city': 'category',
+}
+
+# Carregando os dados (baixa o CSV uma vez e guarda em Parquet localmente)
+def load_df():
+    if CACHE_PATH.exists():
+        return pd.read_parquet(CACHE_PATH, engine='pyarrow', columns=expected_cols_from_user)
+
+    # Verificando colunas esperadas (só o cabeçalho, já que o usecols falha antes com colunas faltando)
+    csv_columns = pd.read_csv(CSV_URL, nrows=0).columns
+    missing_cols = [col for col in expected_cols_from_user if col not in csv_columns]
+    if missing_cols:
+        print(f"Erro: O arquivo CSV está faltando as seguintes colunas esperadas: {', '.join(missing_cols)}")
+        print(f"Colunas disponíveis são: {', '.join(csv_columns)}")
+        exit()
+
+    df_csv = pd.read_csv(CSV_URL, usecols=expected_cols_from_user, dtype=expected_dtypes)
+    # Corrigindo nome do país antes de gravar o cache, assim só é feito no primeiro download
+    df_csv['Country_Name'] = df_csv['Country_Name'].cat.rename_categories({'United States': 'United States of America'})
+    # Grava num arquivo temporário e renomeia, para outro worker nunca ler um Parquet pela metade;
+    # se não for possível gravar (diretório somente leitura, disco cheio), segue sem o cache
+    tmp_path = CACHE_PATH.with_name(f'{CACHE_PATH.name}.{os.getpid()}.tmp')
+    try:
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        df_csv.to_parquet(tmp_path, engine='pyarrow', compression='snappy', index=False)
+        os.replace(tmp_path, CACHE_PATH)
+    except OSError as e:
+        print(f"Aviso: não foi possível gravar o cache em {CACHE_PATH}: {e}")
+        tmp_path.unlink(missing_ok=True)
+    return df_csv
 
-# Carregando os dados
 try:
-    df_full = pd.read_csv('https://raw.githubusercontent.com/07leonam/plot_vsd/refs/heads/main/Summer_olympic_Medals.csv')
+    df_full = load_df()
 except FileNotFoundError:
     print("Erro: 'Summer_olympic_Medals.csv' não encontrado. Certifique-se de que o arquivo está no diretório correto.")
     exit()
@@ -14,37 +71,100 @@ except Exception as e:
     print(f"Erro ao carregar o CSV: {e}")
     exit()
 
-# Verificando colunas esperadas
-expected_cols_from_user = ['Year', 'Host_country', 'Host_city', 'Country_Name', 'Country_Code', 'Gold', 'Silver', 'Bronze']
-missing_cols = [col for col in expected_cols_from_user if col not in df_full.columns]
-if missing_cols:
-    print(f"Erro: O arquivo CSV está faltando as seguintes colunas esperadas: {', '.join(missing_cols)}")
-    print(f"Colunas disponíveis são: {', '.join(df_full.columns)}")
-    exit()
-
-# Corrigindo nome do país
-df_full['Country_Name'] = df_full['Country_Name'].replace('United States', 'United States of America')
-
 # Filtrando anos
-df = df_full[(df_full['Year'] >= 1992) & (df_full['Year'] <= 2020)].copy()
+df = df_full.query('1992 <= Year <= 2020').copy()
+
+# Removendo as categorias dos países que não aparecem no período
+df['Country_Name'] = df['Country_Name'].cat.remove_unused_categories()
 
 # Calculando total de medalhas
-df['Total_Medals'] = df['Gold'] + df['Silver'] + df['Bronze']
+df['Total_Medals'] = df[['Gold', 'Silver', 'Bronze']].to_numpy(dtype=np.int16).sum(axis=1, dtype=np.int16)
 
 # Preparando listas para os dropdowns
-all_countries = sorted(df['Country_Name'].unique())
+all_countries = df['Country_Name'].cat.categories.sort_values().tolist()
 medal_types = ['Gold', 'Silver', 'Bronze', 'Total_Medals']
 
+# Códigos ISO-3 para o mapa. O CSV traz códigos do COI, que diferem do ISO-3 para vários países;
+# equipes históricas/neutras (EUN, TCH, YUG, SCG, IOP, ROC, KOS) ficam sem correspondência no mapa
+IOC_TO_ISO3 = {
+    'ALG': 'DZA', 'BAH': 'BHS', 'BAR': 'BRB', 'BER': 'BMU', 'BOT': 'BWA', 'BRN': 'BHR', 'BUL': 'BGR',
+    'BUR': 'BFA', 'CHI': 'CHL', 'CRC': 'CRI', 'CRO': 'HRV', 'DEN': 'DNK', 'FIJ': 'FJI', 'GER': 'DEU',
+    'GRE': 'GRC', 'GRN': 'GRD', 'GUA': 'GTM', 'INA': 'IDN', 'IRI': 'IRN', 'KSA': 'SAU', 'KUW': 'KWT',
+    'LAT': 'LVA', 'MAS': 'MYS', 'MGL': 'MNG', 'MRI': 'MUS', 'NED': 'NLD', 'NGR': 'NGA', 'PAR': 'PRY',
+    'PHI': 'PHL', 'POR': 'PRT', 'PUR': 'PRI', 'RSA': 'ZAF', 'SAM': 'WSM', 'SIN': 'SGP', 'SLO': 'SVN',
+    'SRI': 'LKA', 'SUD': 'SDN', 'SUI': 'CHE', 'TGA': 'TON', 'TOG': 'TGO', 'TPE': 'TWN', 'TRI': 'TTO',
+    'UAE': 'ARE', 'URU': 'URY', 'VIE': 'VNM', 'ZAM': 'ZMB', 'ZIM': 'ZWE',
+}
+country_codes = df.dropna(subset=['Country_Code']).drop_duplicates('Country_Name')
+COUNTRY_ISO3 = {'Niger': 'NER'}  # Niger aparece sem código no CSV
+COUNTRY_ISO3.update((name, IOC_TO_ISO3.get(code, code))
+                    for name, code in country_codes[['Country_Name', 'Country_Code']].itertuples(index=False, name=None))
+
+# Pré-calculando agregações (o df não muda depois de carregado) com o group_by do polars,
+# que soma as quatro colunas de medalhas em uma única passada; só o resultado volta para o pandas
+medal_lf = pl.from_pandas(df[['Country_Name', 'Year', *medal_types]]).lazy() \
+    .with_columns(pl.col('Country_Name').cast(pl.String))
+
+def medal_sums(lf, keys):
+    agg = lf.group_by(keys).agg([pl.col(medal).sum() for medal in medal_types]).sort(keys).collect().to_pandas()
+    agg['Country_Name'] = agg['Country_Name'].astype(pd.CategoricalDtype(all_countries))
+    return agg
+
+COUNTRY_AGG = medal_sums(medal_lf, ['Country_Name'])
+COUNTRY_YEAR_SUMS = medal_sums(medal_lf, ['Country_Name', 'Year'])
+
+MAP_AGG = {medal: COUNTRY_AGG[['Country_Name', medal]]
+                    .assign(ISO3=lambda agg: agg['Country_Name'].map(COUNTRY_ISO3).astype(object))
+           for medal in medal_types}
+COUNTRY_YEAR_AGG = {medal: COUNTRY_YEAR_SUMS.set_index('Country_Name')[['Year', medal]] for medal in medal_types}
+TOP10 = {medal: COUNTRY_AGG.set_index('Country_Name')[medal].nlargest(10).index for medal in medal_types}
+PIE_SUMS = {name: (int(gold), int(silver), int(bronze))
+            for name, gold, silver, bronze in COUNTRY_AGG[['Country_Name', 'Gold', 'Silver', 'Bronze']].itertuples(index=False, name=None)}
+# Somas por país em cada ano (usado pelo gráfico de barras)
+YEAR_SLICES = {int(year): year_agg.reset_index(drop=True) for year, year_agg in COUNTRY_YEAR_SUMS.groupby('Year')}
+
 # Criando opções de ano
-year_host_info = df[['Year', 'Host_city', 'Host_country']].drop_duplicates().sort_values('Year')
+year_host_info = df[['Year', 'Host_city', 'Host_country']].drop_duplicates(['Year']).sort_values('Year')
 year_options = [{'label': 'Todos os anos (1992-2020)', 'value': 'All'}] + \
-               [{'label': f"{row['Year']} - {row['Host_city']}, {row['Host_country']}", 'value': row['Year']}
-                for index, row in year_host_info.iterrows()]
+               [{'label': f"{year} - {city}, {country}", 'value': year}
+                for year, city, country in year_host_info.itertuples(index=False, name=None)]
+YEAR_LABELS = {opt['value']: opt['label'] for opt in year_options}
+
+# Os callbacks usam só as tabelas pré-calculadas acima, então os dados brutos podem ser liberados
+del df_full, df, medal_lf, country_codes
 
 # Inicializando o app Dash
 app = dash.Dash(__name__)
 server = app.server
 
+# Cache das figuras geradas pelos callbacks (compartilhado entre os workers do gunicorn).
+# A versão muda junto com o código ou com o formato dos dados; quando muda, o cache é limpo
+# para um deploy nunca reaproveitar figuras antigas
+FIGURE_CACHE_VERSION = hashlib.sha1(Path(__file__).read_bytes() + str(CACHE_VERSION).encode()).hexdigest()[:12]
+cache = Cache(app.server, config={
+    'CACHE_TYPE': 'FileSystemCache',
+    'CACHE_DIR': '.flask_cache',
+    'CACHE_KEY_PREFIX': f'{FIGURE_CACHE_VERSION}_',
+    'CACHE_DEFAULT_TIMEOUT': 3600,
+})
+if cache.get('figure_cache_version') != FIGURE_CACHE_VERSION:
+    cache.clear()
+    cache.set('figure_cache_version', FIGURE_CACHE_VERSION, timeout=0)
+
+# Guarda no cache a figura já serializada em JSON, evitando reconstruir e
+# reserializar a Figure a cada requisição
+def memo_prejson(fn):
+    # Namespace próprio no cache, distinto do da função original (que guardava a Figure)
+    @cache.memoize(make_name=lambda name: f'{name}_json')
+    @functools.wraps(fn)
+    def cached_json(*args):
+        return pio.to_json(fn(*args), validate=False)
+
+    @functools.wraps(fn)
+    def wrapper(*args):
+        return orjson.loads(cached_json(*args))
+    return wrapper
+
 # Layout do app
 app.layout = html.Div(children=[
     html.H1("Painel de Medalhas Olímpicas (1992-2020)", style={'textAlign': 'center'}),
@@ -85,7 +205,8 @@ app.layout = html.Div(children=[
 
     html.Div(className='charts-row', children=[
         html.Div([dcc.Graph(id='area-chart')], style={'width': '48%', 'display': 'inline-block', 'padding': '10px'}),
-        html.Div([dcc.Graph(id='bar-chart')], style={'width': '48%', 'display': 'inline-block', 'padding': '10px'}),
+        html.Div([dcc.Graph(id='bar-chart'), dcc.Store(id='bar-chart-base')],
+                 style={'width': '48%', 'display': 'inline-block', 'padding': '10px'}),
     ], style={'display': 'flex', 'justifyContent': 'center', 'flexWrap': 'wrap'})
 ])
 
@@ -94,22 +215,22 @@ app.layout = html.Div(children=[
     Output('pie-chart', 'figure'),
     [Input('country-dropdown', 'value')]
 )
+@memo_prejson
 def update_pie_chart(selected_country):
     if not selected_country:
         fig = px.pie(title="Por favor, selecione um país")
         fig.update_layout(annotations=[dict(text='Nenhum país selecionado', showarrow=False)])
         return fig
 
-    country_data = df[df['Country_Name'] == selected_country]
-    if country_data.empty:
+    if selected_country not in PIE_SUMS:
         fig = px.pie(title=f"Sem dados para {selected_country} (1992-2020)")
         fig.update_layout(annotations=[dict(text='Dados não disponíveis', showarrow=False)])
         return fig
 
-    medal_sum = country_data[['Gold', 'Silver', 'Bronze']].sum()
+    gold, silver, bronze = PIE_SUMS[selected_country]
     medal_counts_df = pd.DataFrame({
         'Tipo de Medalha': ['Ouro', 'Prata', 'Bronze'],
-        'Quantidade': [medal_sum.get('Gold', 0), medal_sum.get('Silver', 0), medal_sum.get('Bronze', 0)]
+        'Quantidade': [gold, silver, bronze]
     })
 
     fig_pie = px.pie(medal_counts_df,
@@ -121,35 +242,24 @@ def update_pie_chart(selected_country):
     fig_pie.update_traces(textposition='inside', textinfo='percent+label+value')
     return fig_pie
 
-# Callback do mapa
-@app.callback(
-    Output('map-chart', 'figure'),
-    [Input('medal-type-dropdown', 'value')]
-)
-def update_map_chart(selected_medal_type):
-    medal_col = selected_medal_type
-    map_data = df.groupby('Country_Name', as_index=False)[medal_col].sum()
+# Figuras do mapa e da área (dependem só do tipo de medalha, então são montadas uma única vez)
+def build_map_fig(medal_col):
+    map_data = MAP_AGG[medal_col]
 
     fig_map = px.choropleth(map_data,
-                            locations='Country_Name',
-                            locationmode='country names',
+                            locations='ISO3',
+                            locationmode='ISO-3',
                             color=medal_col,
                             hover_name='Country_Name',
+                            hover_data={'ISO3': False, 'Country_Name': True},
                             color_continuous_scale=px.colors.sequential.YlOrRd,
                             title=f'Total de {medal_col.replace("_", " ")} por país (1992-2020)')
     return fig_map
 
-# Callback da área
-@app.callback(
-    Output('area-chart', 'figure'),
-    [Input('medal-type-dropdown', 'value')]
-)
-def update_area_chart(selected_medal_type):
-    medal_col = selected_medal_type
-
-    df_country_year_medals = df.groupby(['Country_Name', 'Year'], as_index=False)[medal_col].sum()
-    top_10_countries_overall = df.groupby('Country_Name')[medal_col].sum().nlargest(10).index
-    df_top_10 = df_country_year_medals[df_country_year_medals['Country_Name'].isin(top_10_countries_overall)]
+def build_area_fig(medal_col):
+    df_country_year_medals = COUNTRY_YEAR_AGG[medal_col]
+    top_10_countries_overall = TOP10[medal_col]
+    df_top_10 = df_country_year_medals.loc[top_10_countries_overall.sort_values()].reset_index()
 
     fig_area = px.area(df_top_10,
                        x="Year",
@@ -160,41 +270,70 @@ def update_area_chart(selected_medal_type):
     fig_area.update_xaxes(type='category')
     return fig_area
 
-# Callback do gráfico de barras
+MAP_FIGURES_JSON = {medal: pio.to_json(build_map_fig(medal), validate=False) for medal in medal_types}
+AREA_FIGURES_JSON = {medal: pio.to_json(build_area_fig(medal), validate=False) for medal in medal_types}
+
+# Callback do mapa
 @app.callback(
-    Output('bar-chart', 'figure'),
+    Output('map-chart', 'figure'),
+    [Input('medal-type-dropdown', 'value')]
+)
+def update_map_chart(selected_medal_type):
+    return orjson.loads(MAP_FIGURES_JSON[selected_medal_type])
+
+# Callback da área
+@app.callback(
+    Output('area-chart', 'figure'),
+    [Input('medal-type-dropdown', 'value')]
+)
+def update_area_chart(selected_medal_type):
+    return orjson.loads(AREA_FIGURES_JSON[selected_medal_type])
+
+# Callback do gráfico de barras (a figura sai sem cor; a cor é aplicada no navegador)
+@app.callback(
+    Output('bar-chart-base', 'data'),
     [Input('medal-type-dropdown', 'value'),
      Input('year-dropdown', 'value')]
 )
+@memo_prejson
 def update_bar_chart(selected_medal_type, selected_year_value):
     medal_col = selected_medal_type
-    current_df_bar = df.copy()
-    
+
     year_title_segment = "Todos os anos (1992-2020)"
     if selected_year_value != 'All':
-        current_df_bar = current_df_bar[current_df_bar['Year'] == selected_year_value]
-        year_label_info_obj = next((item for item in year_options if item['value'] == selected_year_value), None)
-        if year_label_info_obj:
-            year_title_segment = year_label_info_obj['label']
-        else:
-            year_title_segment = str(selected_year_value)
-
-    df_grouped_bar = current_df_bar.groupby('Country_Name', as_index=False)[medal_col].sum()
-    df_grouped_bar = df_grouped_bar.nlargest(10, medal_col)
+        year_title_segment = YEAR_LABELS.get(selected_year_value, str(selected_year_value))
 
-    bar_color_val = None
-    if medal_col == 'Gold': bar_color_val = 'gold'
-    elif medal_col == 'Silver': bar_color_val = 'silver'
-    elif medal_col == 'Bronze': bar_color_val = '#cd7f32'
+    if selected_year_value == 'All':
+        df_grouped_bar = MAP_AGG[medal_col]
+    else:
+        df_grouped_bar = YEAR_SLICES.get(selected_year_value, COUNTRY_YEAR_SUMS.iloc[:0])
+    df_grouped_bar = df_grouped_bar.nlargest(10, medal_col)
 
     fig_bar = px.bar(df_grouped_bar,
                      x='Country_Name',
                      y=medal_col,
                      title=f'Top 10 países por {medal_col.replace("_", " ")} em {year_title_segment}',
                      labels={'Country_Name': 'País', medal_col: medal_col.replace("_", " ")})
-    if bar_color_val:
-        fig_bar.update_traces(marker_color=bar_color_val)
     return fig_bar
 
+# Cor das barras de acordo com o tipo de medalha, aplicada no cliente
+app.clientside_callback(
+    """
+    function(fig, medal) {
+        if (!fig) {
+            return window.dash_clientside.no_update;
+        }
+        const color = {'Gold': 'gold', 'Silver': 'silver', 'Bronze': '#cd7f32'}[medal];
+        if (!color) {
+            return fig;
+        }
+        return {...fig, data: fig.data.map(trace => ({...trace, marker: {...trace.marker, color: color}}))};
+    }
+    """,
+    Output('bar-chart', 'figure'),
+    Input('bar-chart-base', 'data'),
+    State('medal-type-dropdown', 'value')
+)
+
 if __name__ == '__main__':
     app.run_server(debug=True)